@@ -1,7 +1,9 @@
+import os
+from pathlib import Path
 import pandas as pd
 import sqlite3
 import customtkinter as ctk
-from tkinter import filedialog, messagebox, Toplevel, StringVar
+from tkinter import filedialog, messagebox, Toplevel, StringVar, BooleanVar
 import win32com.client as win32 
 
 
@@ -9,46 +11,258 @@ DB_PATH = 'app/data/database.sqlite'
 report = None  # Variable global para almacenar el reporte
 parameters = {}  # Diccionario para almacenar los parámetros de cada empresa
 
-def load_data(db_path):
+
+def month_key_sql(column):
+    """
+    Construye la expresión SQL que obtiene la clave de mes (YYYYMM) de una fecha ISO.
+
+    Solo se usa la parte de la fecha (YYYY-MM-DD) para que un desfase horario no cambie el mes,
+    igual que al interpretar la fecha con pandas. Las fechas inexistentes y los demás formatos devuelven NULL
+    y se dejan a la interpretación con pandas.
+
+    Args:
+        column (str): Columna o expresión con la fecha.
+
+    Returns:
+        str: Expresión SQL de la clave de mes.
+    """
+    # date() con un modificador normaliza fechas inexistentes ('2024-02-30' pasa a '2024-03-01'), así que la comparación solo acepta fechas reales
+    return (f"CASE WHEN {column} GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*' "
+            f"AND date(substr({column}, 1, 10), '+0 days') = substr({column}, 1, 10) "
+            f"THEN CAST(strftime('%Y%m', substr({column}, 1, 10)) AS INTEGER) END")
+
+# Consultas SQL que emite la aplicación
+LOAD_CALLS_QUERY = "SELECT * FROM apicall WHERE month_key BETWEEN ? AND ?"
+LOAD_CONTRACTS_QUERY = "SELECT * FROM commerce"
+BACKFILL_MONTH_KEYS_QUERY = f"UPDATE apicall SET month_key = {month_key_sql('date_api_call')} WHERE month_key IS NULL"
+PENDING_DATES_QUERY = "SELECT rowid AS row_id, date_api_call FROM apicall WHERE month_key IS NULL AND date_api_call IS NOT NULL"
+UPDATE_MONTH_KEY_QUERY = "UPDATE apicall SET month_key = ? WHERE rowid = ?"
+HAS_PENDING_MONTH_KEYS_QUERY = "SELECT 1 FROM apicall WHERE month_key IS NULL AND date_api_call IS NOT NULL LIMIT 1"
+COUNT_UNREADABLE_DATES_QUERY = "SELECT COUNT(*) FROM apicall WHERE (month_key IS NULL OR month_key = 0) AND date_api_call IS NOT NULL"
+SNAPSHOT_COMMERCE_QUERY = "CREATE TABLE main.commerce AS SELECT * FROM source.commerce"
+SNAPSHOT_CONDITIONS_QUERY = "CREATE TABLE main.conditions_commerce AS SELECT * FROM source.conditions_commerce"
+SNAPSHOT_CALLS_QUERY = "CREATE TABLE main.apicall AS SELECT * FROM source.apicall WHERE month_key BETWEEN ? AND ?"
+INSERT_CONDITION_QUERY = "INSERT INTO conditions_commerce (commerce_id, ranged_option, min_value, max_value, rate, type_condition) VALUES (?, ?, ?, ?, ?, ?)"
+UPDATE_CONDITION_QUERY = "UPDATE conditions_commerce SET ranged_option = ?, min_value = ?, max_value = ?, rate = ?, type_condition = ? WHERE id = ?"
+UPDATE_FIXED_CONDITION_QUERY = "UPDATE conditions_commerce SET ranged_option = ?, min_value = ?, max_value = ?, rate = ?, type_condition = ? WHERE commerce_id = ? AND ranged_option = 'fixed'"
+DELETE_CONDITION_QUERY = "DELETE FROM conditions_commerce WHERE id = ?"
+CONDITION_BY_ID_QUERY = "SELECT * FROM conditions_commerce WHERE id = ?"
+CONDITIONS_BY_COMMERCE_QUERY = "SELECT * FROM conditions_commerce WHERE commerce_id = ?"
+CONDITION_TYPES_BY_COMMERCE_QUERY = "SELECT id, ranged_option FROM conditions_commerce WHERE commerce_id = ?"
+COMMERCE_EXISTS_QUERY = "SELECT 1 FROM commerce WHERE commerce_id = ?"
+COMMERCE_NAME_QUERY = "SELECT commerce_name FROM commerce WHERE commerce_id = ?"
+
+# Índice de condiciones por comercio, compartido por la migración y el snapshot
+CONDITIONS_COMMERCE_INDEX = "idx_conditions_commerce_commerce_id ON conditions_commerce (commerce_id, ranged_option)"
+
+# Consultas por clave revisadas con EXPLAIN QUERY PLAN. Las cargas completas de 'commerce' y
+# 'conditions_commerce' son recorridos intencionales y la inserción no tiene plan, así que no se incluyen.
+QUERY_PLAN_CHECKS = [
+    ("Load calls by month", LOAD_CALLS_QUERY),
+    ("Backfill month keys", BACKFILL_MONTH_KEYS_QUERY),
+    ("Pending month keys", PENDING_DATES_QUERY),
+    ("Update month key", UPDATE_MONTH_KEY_QUERY),
+    ("Has pending month keys", HAS_PENDING_MONTH_KEYS_QUERY),
+    ("Count unreadable dates", COUNT_UNREADABLE_DATES_QUERY),
+    ("Snapshot calls by month", SNAPSHOT_CALLS_QUERY),
+    ("Conditions by commerce", CONDITIONS_BY_COMMERCE_QUERY),
+    ("Condition types by commerce", CONDITION_TYPES_BY_COMMERCE_QUERY),
+    ("Update fixed condition", UPDATE_FIXED_CONDITION_QUERY),
+    ("Condition by id", CONDITION_BY_ID_QUERY),
+    ("Update condition", UPDATE_CONDITION_QUERY),
+    ("Delete condition", DELETE_CONDITION_QUERY),
+    ("Commerce exists", COMMERCE_EXISTS_QUERY),
+    ("Commerce name", COMMERCE_NAME_QUERY),
+]
+
+def normalize_apicall_dates(db_path):
     """
-    Carga los datos de la tabla 'apicall' desde la base de datos SQLite.
+    Normaliza las fechas de la tabla 'apicall' guardando una clave de mes entera (YYYYMM) en la columna 'month_key'.
+
+    La primera ejecución agrega la columna, la llena, crea su índice y los triggers que la mantienen
+    actualizada en cada inserción o modificación. Las ejecuciones siguientes solo completan las filas pendientes.
+    Las fechas que no se pueden interpretar quedan con clave 0.
 
     Args:
         db_path (str): Ruta a la base de datos SQLite.
 
+    Returns:
+        bool: True si la normalización se aplicó; False si no se pudo escribir en la base de datos.
+    """
+    normalized = False
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        columns = {column[1] for column in cursor.execute('PRAGMA table_info(apicall)')}
+        if 'month_key' not in columns:
+            cursor.execute('ALTER TABLE apicall ADD COLUMN month_key INTEGER')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_apicall_month_key ON apicall (month_key)')
+
+        # Fechas en formato ISO: se resuelven directamente en SQLite
+        cursor.execute(BACKFILL_MONTH_KEYS_QUERY)
+
+        # Fechas en otros formatos: se interpretan una sola vez con pandas
+        pending = pd.read_sql_query(PENDING_DATES_QUERY, conn)
+        if not pending.empty:
+            dates = pd.to_datetime(pending['date_api_call'], format='mixed', errors='coerce')
+            # Las fechas ilegibles quedan con clave 0 para no volver a interpretarlas en cada cálculo
+            pending['month_key'] = dates.map(lambda date: date.year * 100 + date.month if pd.notna(date) else 0)
+            cursor.executemany(UPDATE_MONTH_KEY_QUERY,
+                               zip(pending['month_key'].astype(int).tolist(), pending['row_id'].tolist()))
+
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_apicall_month_key_insert AFTER INSERT ON apicall
+            WHEN NEW.month_key IS NULL
+            BEGIN
+                UPDATE apicall SET month_key = {month_key_sql('NEW.date_api_call')} WHERE rowid = NEW.rowid;
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_apicall_month_key_update AFTER UPDATE OF date_api_call ON apicall
+            BEGIN
+                UPDATE apicall SET month_key = {month_key_sql('NEW.date_api_call')} WHERE rowid = NEW.rowid;
+            END
+        ''')
+        conn.commit()
+        normalized = True
+    except Exception as e:
+        print(f"Error normalizing dates: {e}")
+    finally:
+        conn.close()
+    return normalized
+
+def open_read_only(db_path):
+    """
+    Abre una conexión de solo lectura a la base de datos SQLite, sin crear el archivo si no existe.
+
+    Args:
+        db_path (str): Ruta a la base de datos SQLite.
+
+    Returns:
+        sqlite3.Connection: Conexión de solo lectura.
+    """
+    return sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+
+def has_pending_month_keys(db_path):
+    """
+    Indica si hay llamadas de 'apicall' con fecha que aún no tienen clave de mes.
+
+    La consulta es de solo lectura, por lo que no bloquea al editor de condiciones.
+
+    Args:
+        db_path (str): Ruta a la base de datos SQLite.
+
+    Returns:
+        bool: True si hay llamadas pendientes o si no se pudo comprobar (por ejemplo, falta la columna 'month_key').
+    """
+    conn = open_read_only(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(HAS_PENDING_MONTH_KEYS_QUERY)
+        pending = cursor.fetchone() is not None
+    except Exception as e:
+        print(f"Error checking pending month keys: {e}")
+        pending = True
+    finally:
+        conn.close()
+    return pending
+
+def count_unreadable_dates(db_path):
+    """
+    Cuenta las llamadas de 'apicall' con fecha pero sin una clave de mes válida, es decir, con fechas que no se pudieron interpretar.
+
+    Args:
+        db_path (str): Ruta a la base de datos SQLite.
+
+    Returns:
+        int: Número de llamadas sin clave de mes válida, o None si no se pudo contar.
+    """
+    conn = open_read_only(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(COUNT_UNREADABLE_DATES_QUERY)
+        unreadable = cursor.fetchone()[0]
+    except Exception as e:
+        print(f"Error counting unreadable dates: {e}")
+        unreadable = None
+    finally:
+        conn.close()
+    return unreadable
+
+def open_calculation_connection(db_path, use_snapshot, start_key, end_key):
+    """
+    Abre la conexión sobre la que se ejecuta el cálculo de comisiones.
+
+    Con la opción de snapshot, copia a una base de datos en memoria las tablas 'commerce' y
+    'conditions_commerce' y las llamadas de 'apicall' del rango de meses, dentro de una sola
+    transacción de lectura. La copia es consistente en un solo instante, por lo que las ediciones
+    de condiciones durante el cálculo no la afectan ni quedan bloqueadas por él.
+
+    Args:
+        db_path (str): Ruta a la base de datos SQLite.
+        use_snapshot (bool): Indica si se trabaja sobre una copia en memoria.
+        start_key (int): Mes inicial en formato YYYYMM.
+        end_key (int): Mes final en formato YYYYMM.
+
+    Returns:
+        sqlite3.Connection: Conexión a la base de datos o a su copia en memoria.
+
+    Raises:
+        sqlite3.Error: Si no se pudo crear la copia en memoria.
+    """
+    if not use_snapshot:
+        return sqlite3.connect(db_path)
+
+    # uri=True es necesario para que ATTACH interprete la URI con mode=ro; sin él la abre como nombre de archivo
+    snapshot = sqlite3.connect(':memory:', uri=True)
+    try:
+        snapshot.execute('ATTACH DATABASE ? AS source', (f"{Path(db_path).resolve().as_uri()}?mode=ro",))
+        snapshot.execute('BEGIN')
+        snapshot.execute(SNAPSHOT_COMMERCE_QUERY)
+        snapshot.execute(SNAPSHOT_CONDITIONS_QUERY)
+        snapshot.execute(SNAPSHOT_CALLS_QUERY, (start_key, end_key))
+        snapshot.execute(f'CREATE INDEX main.{CONDITIONS_COMMERCE_INDEX}')
+        snapshot.commit()
+        snapshot.execute('DETACH DATABASE source')
+    except Exception:
+        snapshot.close()
+        raise
+    return snapshot
+
+def load_data(conn, start_key, end_key):
+    """
+    Carga los datos de la tabla 'apicall' para un rango de meses.
+
+    Args:
+        conn (sqlite3.Connection): Conexión a la base de datos SQLite.
+        start_key (int): Mes inicial en formato YYYYMM.
+        end_key (int): Mes final en formato YYYYMM.
+
     Returns:
         pd.DataFrame: DataFrame con los datos cargados.
     """
     try:
-        conn = sqlite3.connect(db_path)
-        query = "SELECT * FROM apicall"
-        data = pd.read_sql_query(query, conn)
+        data = pd.read_sql_query(LOAD_CALLS_QUERY, conn, params=(start_key, end_key))
     except Exception as e:
         print(f"Error loading data: {e}")
         data = pd.DataFrame()
-    finally:
-        conn.close()
     return data
 
-def load_contracts(db_path):
+def load_contracts(conn):
     """
-    Carga los contratos de la tabla 'commerce' desde la base de datos SQLite.
+    Carga los contratos de la tabla 'commerce'.
 
     Args:
-        db_path (str): Ruta a la base de datos SQLite.
+        conn (sqlite3.Connection): Conexión a la base de datos SQLite.
 
     Returns:
         pd.DataFrame: DataFrame con los contratos cargados.
     """
     try:
-        conn = sqlite3.connect(db_path)
-        query = "SELECT * FROM commerce"
-        contracts = pd.read_sql_query(query, conn)
+        contracts = pd.read_sql_query(LOAD_CONTRACTS_QUERY, conn)
     except Exception as e:
         print(f"Error loading contracts: {e}")
         contracts = pd.DataFrame()
-    finally:
-        conn.close()
     return contracts
 
 def clean_data(data):
@@ -100,10 +314,7 @@ def add_condition(commerce_id, ranged_option, min_value, max_value, rate, type_c
     try:
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO conditions_commerce (commerce_id, ranged_option, min_value, max_value, rate, type_condition)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (commerce_id, ranged_option, min_value, max_value, rate, type_condition))
+        cursor.execute(INSERT_CONDITION_QUERY, (commerce_id, ranged_option, min_value, max_value, rate, type_condition))
         conn.commit()
         messagebox.showinfo("Success", "Condition added successfully!")
     except Exception as e:
@@ -126,11 +337,7 @@ def update_condition(condition_id, ranged_option, min_value, max_value, rate, ty
     try:
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE conditions_commerce
-            SET ranged_option = ?, min_value = ?, max_value = ?, rate = ?, type_condition = ?
-            WHERE id = ?
-        ''', (ranged_option, min_value, max_value, rate, type_condition, condition_id))
+        cursor.execute(UPDATE_CONDITION_QUERY, (ranged_option, min_value, max_value, rate, type_condition, condition_id))
         conn.commit()
         messagebox.showinfo("Success", "Condition updated successfully!")
     except Exception as e:
@@ -148,7 +355,7 @@ def delete_condition(condition_id):
     try:
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
-        cursor.execute('DELETE FROM conditions_commerce WHERE id = ?', (condition_id,))
+        cursor.execute(DELETE_CONDITION_QUERY, (condition_id,))
         conn.commit()
         messagebox.showinfo("Success", "Condition deleted successfully!")
     except Exception as e:
@@ -156,17 +363,13 @@ def delete_condition(condition_id):
     finally:
         conn.close()
 
-def calculate_commissions(data):
+def request_period():
     """
-    Calcula las comisiones basadas en los datos y las condiciones almacenadas en la base de datos.
-
-    Args:
-        data (pd.DataFrame): DataFrame con los datos.
+    Solicita al usuario el rango de meses que se desea calcular.
 
     Returns:
-        pd.DataFrame: DataFrame con las comisiones calculadas.
+        tuple: Períodos de pandas de inicio y fin.
     """
-    # Solicitar los meses que se desean calcular
     start_month_dialog = ctk.CTkInputDialog(text="Ingrese el fecha de inicio (YYYY-MM):", title="Fecha de Inicio")
     start_month_dialog.geometry("+{}+{}".format(int(start_month_dialog.winfo_screenwidth()/2 - start_month_dialog.winfo_reqwidth()/2), 
                                                 int(start_month_dialog.winfo_screenheight()/2 - start_month_dialog.winfo_reqheight()/2)))
@@ -180,10 +383,34 @@ def calculate_commissions(data):
     # Convertir las entradas a períodos de pandas
     start_period = pd.Period(start_month, freq='M')
     end_period = pd.Period(end_month, freq='M')
+    return start_period, end_period
 
-    # Filtrar los datos para los meses seleccionados
-    data['month'] = pd.to_datetime(data['date_api_call']).dt.to_period('M')
-    data = data[(data['month'] >= start_period) & (data['month'] <= end_period)]
+def period_to_month_key(period):
+    """
+    Convierte un período mensual de pandas a la clave entera YYYYMM usada en 'apicall.month_key'.
+
+    Args:
+        period (pd.Period): Período mensual.
+
+    Returns:
+        int: Clave del mes.
+    """
+    return period.year * 100 + period.month
+
+def calculate_commissions(data, conn):
+    """
+    Calcula las comisiones basadas en los datos y las condiciones almacenadas en la base de datos.
+
+    Args:
+        data (pd.DataFrame): DataFrame con los datos, ya filtrados por los meses seleccionados.
+        conn (sqlite3.Connection): Conexión de la que se leen las condiciones.
+
+    Returns:
+        pd.DataFrame: DataFrame con las comisiones calculadas.
+    """
+    # Construir el período a partir de la clave del mes, sin interpretar las fechas de texto
+    months = {key: pd.Period(year=int(key) // 100, month=int(key) % 100, freq='M') for key in data['month_key'].unique()}
+    data['month'] = data['month_key'].map(months)
 
     # Filtrar solo las empresas activas
     data = data[data['commerce_status'] == 'Active']
@@ -198,11 +425,9 @@ def calculate_commissions(data):
         successful = row['successful_calls']
         unsuccessful = row['unsuccessful_calls']
         
-        conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM conditions_commerce WHERE commerce_id = ?', (commerce_id,))
+        cursor.execute(CONDITIONS_BY_COMMERCE_QUERY, (commerce_id,))
         conditions = cursor.fetchall()
-        conn.close()
 
         commission = 0
         discount = 0
@@ -229,6 +454,100 @@ def calculate_commissions(data):
     grouped[['commission', 'iva', 'total']] = grouped.apply(calculate_row, axis=1)
     return grouped
 
+def create_indexes(db_path):
+    """
+    Crea los índices que necesitan las consultas de la aplicación sobre 'commerce' y 'conditions_commerce'.
+
+    Args:
+        db_path (str): Ruta a la base de datos SQLite.
+    """
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_commerce_commerce_id ON commerce (commerce_id, commerce_name)')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {CONDITIONS_COMMERCE_INDEX}')
+
+        # 'id' solo necesita índice si no es el alias del rowid (INTEGER PRIMARY KEY)
+        id_column = [column for column in cursor.execute('PRAGMA table_info(conditions_commerce)') if column[1] == 'id']
+        if id_column and not (id_column[0][5] == 1 and id_column[0][2].upper() == 'INTEGER'):
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_conditions_commerce_id ON conditions_commerce (id)')
+        conn.commit()
+    except Exception as e:
+        print(f"Error creating indexes: {e}")
+    finally:
+        conn.close()
+
+def migrate_database(db_path):
+    """
+    Aplica las migraciones de esquema sobre la base de datos seleccionada: clave de mes en 'apicall' e índices.
+
+    Args:
+        db_path (str): Ruta a la base de datos SQLite.
+    """
+    if not db_path or not os.path.exists(db_path):
+        return
+    normalize_apicall_dates(db_path)
+    create_indexes(db_path)
+
+def diagnose_queries(db_path):
+    """
+    Ejecuta EXPLAIN QUERY PLAN sobre las consultas de la aplicación y detecta recorridos completos de tabla.
+
+    Args:
+        db_path (str): Ruta a la base de datos SQLite.
+
+    Returns:
+        tuple: Lista de tuplas (nombre de la consulta, detalle del plan) para cada recorrido completo encontrado
+            y lista de tuplas (nombre de la consulta, error) para las consultas que no se pudieron revisar.
+    """
+    full_scans = []
+    errors = []
+    if not db_path or not os.path.exists(db_path):
+        errors.append(("Database", f"Database file not found: {db_path}"))
+        return full_scans, errors
+
+    # La base de datos se adjunta como 'source' en modo de solo lectura para revisar también las consultas del snapshot;
+    # uri=True es necesario para que ATTACH interprete la URI con mode=ro
+    conn = sqlite3.connect(':memory:', uri=True)
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('ATTACH DATABASE ? AS source', (f"{Path(db_path).resolve().as_uri()}?mode=ro",))
+        except Exception as e:
+            errors.append(("Database", str(e)))
+            return full_scans, errors
+        for name, query in QUERY_PLAN_CHECKS:
+            params = (None,) * query.count('?')
+            try:
+                for step in cursor.execute(f'EXPLAIN QUERY PLAN {query}', params).fetchall():
+                    detail = step[3]
+                    if detail.startswith('SCAN'):
+                        full_scans.append((name, detail))
+            except Exception as e:
+                errors.append((name, str(e)))
+    finally:
+        conn.close()
+    return full_scans, errors
+
+def show_query_diagnostics():
+    """
+    Muestra el resultado del diagnóstico de consultas sobre la base de datos seleccionada.
+    """
+    full_scans, errors = diagnose_queries(DB_PATH)
+    print("\nQuery Plan Diagnostics:")
+    for name, detail in full_scans:
+        print(f"{name}: {detail}")
+    for name, error in errors:
+        print(f"{name}: ERROR {error}")
+
+    if errors:
+        messagebox.showerror("Error", f"{len(errors)} queries could not be checked and {len(full_scans)} use a full table scan. See the console for details.")
+    elif full_scans:
+        messagebox.showwarning("Warning", f"{len(full_scans)} queries use a full table scan. See the console for details.")
+    else:
+        print("No full table scans found.")
+        messagebox.showinfo("Success", "All queries use indexes.")
+
 def select_db_path():
     """
     Abre un cuadro de diálogo para seleccionar la ruta de la base de datos.
@@ -236,16 +555,52 @@ def select_db_path():
     global DB_PATH
     DB_PATH = filedialog.askopenfilename(filetypes=[("SQLite files", "*.sqlite"), ("All files", "*.*")])
     db_path_label.configure(text=f"Database Path: {DB_PATH}")
+    migrate_database(DB_PATH)
 
-def execute_calculation():
+def execute_calculation(use_snapshot=False):
     """
     Ejecuta el cálculo de comisiones y muestra el resultado.
+
+    Args:
+        use_snapshot (bool): Si es True, todo el cálculo se ejecuta sobre una copia en memoria de la base de datos.
     """
     global report
-    data = load_data(DB_PATH)
-    contracts = load_contracts(DB_PATH)
-    data = assign_commerce_names(data, contracts)
-    report = calculate_commissions(data)
+    if not DB_PATH or not os.path.exists(DB_PATH):
+        messagebox.showerror("Error", f"Database file not found: {DB_PATH}")
+        return
+
+    start_period, end_period = request_period()
+    start_key = period_to_month_key(start_period)
+    end_key = period_to_month_key(end_period)
+
+    # Solo se escribe en la base de datos si hay fechas sin normalizar
+    if has_pending_month_keys(DB_PATH) and not normalize_apicall_dates(DB_PATH):
+        messagebox.showerror("Error", "The database could not be migrated to normalize the call dates. Check that the file is not read-only or locked and try again.")
+        return
+
+    # Las llamadas con fechas que no se pudieron interpretar no entran en el rango de meses
+    unreadable_calls = count_unreadable_dates(DB_PATH)
+    if unreadable_calls is None:
+        messagebox.showerror("Error", "Could not check the database for calls with unreadable dates. See the console for details.")
+        return
+    if unreadable_calls:
+        print(f"{unreadable_calls} API calls have an unreadable date_api_call and are excluded from the report.")
+        if not messagebox.askyesno("Warning", f"{unreadable_calls} API calls have a date that could not be read and will not be included in the report.\n\nContinue with the calculation?"):
+            return
+
+    try:
+        conn = open_calculation_connection(DB_PATH, use_snapshot, start_key, end_key)
+    except Exception as e:
+        messagebox.showerror("Error", f"Error opening the database for the calculation: {e}")
+        return
+
+    try:
+        data = load_data(conn, start_key, end_key)
+        contracts = load_contracts(conn)
+        data = assign_commerce_names(data, contracts)
+        report = calculate_commissions(data, conn)
+    finally:
+        conn.close()
     messagebox.showinfo("Success", "Calculation completed successfully!")
     print("\nCommission Report:")
     print(report.head())
@@ -365,13 +720,13 @@ def open_conditions_window():
         cursor = conn.cursor()
         
         # Comprueba si commerce_id existe en la tabla de comercio
-        cursor.execute('SELECT 1 FROM commerce WHERE commerce_id = ?', (commerce_id,))
+        cursor.execute(COMMERCE_EXISTS_QUERY, (commerce_id,))
         if cursor.fetchone() is None:
             messagebox.showerror("Error", "Commerce ID does not exist in the commerce table.", parent=conditions_window)
             conn.close()
             return
         
-        cursor.execute('SELECT * FROM conditions_commerce WHERE commerce_id = ?', (commerce_id,))
+        cursor.execute(CONDITIONS_BY_COMMERCE_QUERY, (commerce_id,))
         conditions = cursor.fetchall()
         conn.close()
         for widget in conditions_frame.winfo_children():
@@ -416,7 +771,7 @@ def open_conditions_window():
         # Comprueba si commerce_id existe en la tabla de comercio
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
-        cursor.execute('SELECT id, ranged_option FROM conditions_commerce WHERE commerce_id = ?', (commerce_id,))
+        cursor.execute(CONDITION_TYPES_BY_COMMERCE_QUERY, (commerce_id,))
         existing_conditions = cursor.fetchall()
 
         if existing_conditions:
@@ -431,11 +786,7 @@ def open_conditions_window():
                 return
             elif ranged_option == 'fixed' and 'fixed' in existing_types:
                 # Update the existing fixed condition
-                cursor.execute('''
-                    UPDATE conditions_commerce
-                    SET ranged_option = ?, min_value = ?, max_value = ?, rate = ?, type_condition = ?
-                    WHERE commerce_id = ? AND ranged_option = 'fixed'
-                ''', (ranged_option, min_value, max_value, rate, type_condition, commerce_id))
+                cursor.execute(UPDATE_FIXED_CONDITION_QUERY, (ranged_option, min_value, max_value, rate, type_condition, commerce_id))
                 conn.commit()
                 messagebox.showinfo("Success", "Fixed condition updated successfully!", parent=conditions_window)
                 load_conditions()
@@ -462,7 +813,7 @@ def open_conditions_window():
 
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM conditions_commerce WHERE id = ?', (condition_id,))
+        cursor.execute(CONDITION_BY_ID_QUERY, (condition_id,))
         condition = cursor.fetchone()
         conn.close()
 
@@ -575,7 +926,7 @@ def open_conditions_window():
         commerce_id = commerce_id_var.get()
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
-        cursor.execute('SELECT commerce_name FROM commerce WHERE commerce_id = ?', (commerce_id,))
+        cursor.execute(COMMERCE_NAME_QUERY, (commerce_id,))
         result = cursor.fetchone()
         conn.close()
         if result:
@@ -666,6 +1017,9 @@ def open_conditions_window():
 
     # Ejecutar la ventana
     toggle_fields(ranged_option_var.get(), min_value_entry, max_value_entry)
+# Migrar la base de datos por defecto antes de abrir la interfaz
+migrate_database(DB_PATH)
+
 # Crear la interfaz gráfica con customtkinter
 ctk.set_appearance_mode("System")  # Modo de apariencia
 ctk.set_default_color_theme("green")  # Tema de color
@@ -675,7 +1029,7 @@ root.title("Commission Calculator")
 
 # Centrar ventana principal
 window_width = 600
-window_height = 400
+window_height = 460
 screen_width = root.winfo_screenwidth()
 screen_height = root.winfo_screenheight()
 position_top = int(screen_height / 4 - window_height / 4)
@@ -690,7 +1044,7 @@ frame = ctk.CTkFrame(root)
 frame.grid(row=0, column=0, sticky="nsew", pady=20, padx=20)
 
 # Configurar el grid layout para el frame
-frame.grid_rowconfigure((0, 1, 2, 3, 4), weight=1)
+frame.grid_rowconfigure((0, 1, 2, 3, 4, 5, 6), weight=1)
 frame.grid_columnconfigure((0, 1), weight=1)
 
 db_path_label = ctk.CTkLabel(frame, text=f"Database Path: {DB_PATH}.", font=("Arial", 16))
@@ -703,8 +1057,12 @@ select_db_button.grid(row=1, column=0,columnspan=2, padx=10, pady=2, sticky="ew"
 manage_conditions_button = ctk.CTkButton(frame, text="Manage Conditions", command=open_conditions_window,font=("Arial", 16, "bold"),height=50)
 manage_conditions_button.grid(row=2, column=0, columnspan=2, padx=10, pady=2, sticky="ew")
 
-calculate_button = ctk.CTkButton(frame, text="Calculate Commissions", command=execute_calculation,font=("Arial", 16, "bold"),height=50)
-calculate_button.grid(row=3, column=0, columnspan=2, padx=10, pady=2, sticky="ew")
+snapshot_var = BooleanVar(value=False)
+calculate_button = ctk.CTkButton(frame, text="Calculate Commissions", command=lambda: execute_calculation(snapshot_var.get()),font=("Arial", 16, "bold"),height=50)
+calculate_button.grid(row=3, column=0, padx=10, pady=2, sticky="ew")
+
+snapshot_checkbox = ctk.CTkCheckBox(frame, text="Use in-memory snapshot", variable=snapshot_var, font=("Arial", 14))
+snapshot_checkbox.grid(row=3, column=1, padx=10, pady=2, sticky="w")
 
 export_button = ctk.CTkButton(frame, text="Export to Excel", command=export_to_excel,font=("Arial", 16, "bold"),height=50)
 export_button.grid(row=4, column=0, columnspan=2, padx=10, pady=2, sticky="ew")
@@ -712,4 +1070,7 @@ export_button.grid(row=4, column=0, columnspan=2, padx=10, pady=2, sticky="ew")
 send_email_button = ctk.CTkButton(frame, text="Send Email", command=send_email,font=("Arial", 16, "bold"),height=50)
 send_email_button.grid(row=5, column=0, columnspan=2, padx=10, pady=2, sticky="ew")
 
+diagnose_button = ctk.CTkButton(frame, text="Diagnose Queries", command=show_query_diagnostics,font=("Arial", 16, "bold"),height=50)
+diagnose_button.grid(row=6, column=0, columnspan=2, padx=10, pady=2, sticky="ew")
+
 root.mainloop()
\ No newline at end of file